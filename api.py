@@ -1,8 +1,25 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from chatbot import MCP_ChatBot
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from chatbot import MCP_ChatBot, StreamError
+from mcp_connection import mcp_pool
+from starlette.types import ASGIApp, Receive, Scope, Send
+from schemas import CacheThreshold, ChatRequest, ChatResponse, ForecastRequest, ForecastResponse
 from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import anyio.to_thread
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+
+# Pre-serialized so liveness probes skip response serialization
+HEALTHY_BODY = b'{"status":"healthy"}'
+
+# Ask proxies not to buffer or cache the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 # Global chatbot instance
 chatbot = None
@@ -10,15 +27,42 @@ chatbot = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    # Size the threadpool used for sync work explicitly instead of relying on the default
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("THREADPOOL", "64"))
+    # Each uvicorn worker runs this and builds its own chatbot and MCP session pool
     global chatbot
-    chatbot = MCP_ChatBot()
+    await mcp_pool.connect()
+    chatbot = MCP_ChatBot(mcp_pool)
     await chatbot.initialize()
     yield
     # Shutdown
-    if chatbot and hasattr(chatbot, 'session') and chatbot.session:
+    if chatbot is not None:
         await chatbot.cleanup()
+    await mcp_pool.disconnect()
+
+class BodySizeLimitMiddleware:
+    """Reject oversized bodies before they are read and validated"""
 
-app = FastAPI(lifespan=lifespan)
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Plain ASGI, so requests without a large body pass through at no cost
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > self.max_bytes:
+                        response = ORJSONResponse(status_code=413, content={"detail": "Request body too large"})
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Added before CORS so CORS wraps it and the 413 carries CORS headers too
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_BODY_BYTES)
 
 # Configure CORS for React app
 app.add_middleware(
@@ -29,44 +73,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class ChatRequest(BaseModel):
-    message: str
-    auth_token: str = None
-
-class ChatResponse(BaseModel):
-    response: str
-
-class ForecastRequest(BaseModel):
-    data: dict
-
-class ForecastResponse(BaseModel):
-    forecast: str
-    insights: str
-
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """Handle chat requests from React frontend"""
     try:
         if not chatbot:
             raise HTTPException(status_code=503, detail="Chatbot not initialized")
-        print(f"Received message: {request.message}")
-        print(f"Auth token received: {request.auth_token}")
+        logger.debug("Received message: %s", request.message)
+        logger.debug("Auth token provided: %s", request.auth_token is not None)
         
         response = await chatbot.process_query(request.message, request.auth_token)
         return ChatResponse(response=response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def sse_events(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Frame each chunk as a server-sent event, one data line per line of text"""
+    async for chunk in chunks:
+        # A failed reply ends with an error event the client can tell apart from the text
+        event = "event: error\n" if isinstance(chunk, StreamError) else ""
+        yield event + "".join(f"data: {line}\n" for line in chunk.split("\n")) + "\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Stream the chat response to the React frontend as it is generated"""
+    if not chatbot:
+        raise HTTPException(status_code=503, detail="Chatbot not initialized")
+    logger.debug("Received message: %s", request.message)
+    
+    return StreamingResponse(
+        sse_events(chatbot.process_query_stream(request.message, request.auth_token)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.post("/chat/clear")
 async def clear_chat_history():
     """Clear the conversation history"""
-    try:
-        if not chatbot:
-            raise HTTPException(status_code=503, detail="Chatbot not initialized")
-        chatbot.clear_history()
-        return {"message": "Chat history cleared"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    if chatbot is None:
+        raise HTTPException(status_code=503, detail="Chatbot not initialized")
+    chatbot.clear_history()
+    return {"message": "Chat history cleared"}
+
+@app.post("/chat/threshold", response_model=CacheThreshold)
+async def set_cache_threshold(request: CacheThreshold):
+    """Set how many exchanges of history still allow cached chat replies"""
+    if chatbot is None:
+        raise HTTPException(status_code=503, detail="Chatbot not initialized")
+    chatbot.sem_cache_max_turns = request.max_turns
+    return request
 
 @app.post("/forecast", response_model=ForecastResponse)
 async def forecast_endpoint(request: ForecastRequest):
@@ -75,7 +130,7 @@ async def forecast_endpoint(request: ForecastRequest):
         if not chatbot:
             raise HTTPException(status_code=503, detail="Chatbot not initialized")
         
-        print(f"Received forecast data: {request.data}")
+        logger.debug("Received forecast data: %s", request.data)
         
         # Use the specialized forecast method
         result = await chatbot.process_forecast(request.data)
@@ -90,8 +145,17 @@ async def forecast_endpoint(request: ForecastRequest):
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return Response(HEALTHY_BODY, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8050)
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8050,
+        # History, caches and /chat/clear live in the process, so one worker unless overridden
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop",
+        http="httptools",
+    )
\ No newline at end of file
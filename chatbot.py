@@ -1,331 +1,596 @@
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp_connection import MCPSessionPool, mcp_pool
 import ollama
+import asyncio
+import cachetools
+import hashlib
+import httpx
 import json
-from typing import List, Dict, Any
-import nest_asyncio
+import logging
+import orjson
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Any
 import os
+import random
 
-nest_asyncio.apply()
+logger = logging.getLogger(__name__)
+
+# DON'T mention the auth_token in the system prompt to prevent hallucination
+_SYSTEM_PROMPT = """You are a helpful equipment booking assistant at Roche. 
+
+You have access to the following tools:
+
+1. search_equipment(site_name) - Search for available equipment at a specific site.
+2. book_equipment(equipment_ids, date, time_start, time_end, number_of_people, reason, timezone) - Create a booking for equipment.
+
+CRITICAL RULES FOR EQUIPMENT BOOKING:
+- Use the EXACT equipment ID for Booking from the search results
+- DO NOT hallucinate equipment ID for Booking
+
+IMPORTANT RULES:
+- Use only ONE tool call per response
+- When you need to use a tool, respond ONLY with the tool call, no additional text
+- If you need to use multiple tools, do them in separate responses
+- When using the book_equipment tool, ensure to pass the EXACT ID for Booking field from the search results
+
+WORKFLOW:
+1. For equipment booking requests: First search for equipment, then book using the EXACT ID for Booking
+2. Always use the full UUID format for equipment IDs
+3. Never truncate or modify equipment IDs
+
+Tool call format, if you write the call out as text:
+{"tool_name": "function_name", "arguments": {"param1": "value1", "param2": "value2"}}
+
+Examples:
+- {"tool_name": "search_equipment", "arguments": {"site_name": "Basel pRED"}}
+- {"tool_name": "book_equipment", "arguments": {"equipment_ids": "09ed436d-7c04-4c74-84f2-54b213cfb0fd", "date": "2025-07-18", "time_start": "14:30", "time_end": "17:00", "number_of_people": 3, "reason": "Calibration tests", "timezone": "Europe/Zurich"}}
+
+Remember: Equipment IDs are always in UUID format (8-4-4-4-12 characters) and must be copied exactly!"""
+
+# Different system prompt for follow-up responses
+_FOLLOWUP_SYSTEM_PROMPT = """You are a helpful equipment booking assistant at Roche. 
+    You have just executed a tool and received the results. Your job is to provide a clear, human-readable summary of the results to the user.
+
+    IMPORTANT: Do NOT return JSON. Provide a natural language response that summarizes the tool results in a helpful way."""
+
+_SYSTEM_MSG = {"role": "system", "content": _SYSTEM_PROMPT}
+
+_FORECAST_SYSTEM_PROMPT = """You are a data analyst specializing in equipment utilization forecasting. Your job is to analyze equipment usage data and generate realistic weekly forecasts with insights.
+
+    IMPORTANT: You must respond with ONLY a valid JSON object in the exact format requested. Do not include any explanatory text, markdown formatting, or additional content.
+
+    The response must be a JSON object with two fields:
+    {
+    "forecast": [...], 
+    "insights": "detailed analysis text"
+    }
+
+    Where:
+    - forecast: A JSON array with exactly 6 objects, each representing a week of forecast data
+    - insights: A string containing detailed analysis, trends, and recommendations
+
+    Forecast array structure:
+    [
+    { "week": "Week 1", "utilization": 67, "hours": 145, "bookings": 12 },
+    { "week": "Week 2", "utilization": 72, "hours": 158, "bookings": 14 },
+    ...
+    ]
+
+    Insights should include:
+    - Analysis of current usage patterns
+    - Predicted trends and their reasoning
+    - Potential risks or opportunities
+    - Recommendations for optimization"""
+
+_FORECAST_SYSTEM_MSG = {"role": "system", "content": _FORECAST_SYSTEM_PROMPT}
+
+# Passed as the forecast call's format so Ollama can only sample JSON of this shape
+_FORECAST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "forecast": {
+            "type": "array",
+            "minItems": 6,
+            "maxItems": 6,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "week": {"type": "string"},
+                    "utilization": {"type": "number"},
+                    "hours": {"type": "number"},
+                    "bookings": {"type": "integer"}
+                },
+                "required": ["week", "utilization", "hours", "bookings"]
+            }
+        },
+        "insights": {"type": "string"}
+    },
+    "required": ["forecast", "insights"]
+}
+
+# The fixed instructions come first and the per-request data last, so every forecast
+# prompt shares the longest possible prefix with the previous one in Ollama's KV cache
+_FORECAST_USER_TEMPLATE = """Generate a realistic 6-week forecast with insights for the equipment data below, considering:
+    1. Current usage trends
+    2. Typical equipment utilization patterns
+    3. Potential seasonal variations
+    4. Team workflow patterns
+
+    Response format: JSON object with forecast array and insights string, no additional text.
+
+    Equipment: {manufacturer} {equipment_model}
+    Team: {team_name}
+    Current Utilization Rate: {current_utilization:.2f}%
+    Historical Usage: {total_bookings} bookings, {total_hours} total hours
+    Average Booking Duration: {avg_booking_duration} minutes
+
+    Historical usage pattern (most recent days):
+    {usage_per_day}"""
+
+# Tools whose results depend only on their arguments, so replies built on them can be cached
+_READ_ONLY_TOOLS = frozenset({"search_equipment"})
+
+# Tools served to the LLM through a compact variant; the variants themselves are hidden from it
+_RAW_TOOL_VARIANTS = {"search_equipment": "search_equipment_raw"}
+
+# Seconds a read-only tool result stays fresh; equipment availability changes over time
+_TOOL_CACHE_TTL = 60
+
+# Past this many exchanges a conversation drifts too much for a cached reply to still be right
+_SEM_CACHE_MAX_TURNS = 6
+
+# orjson has no raw_decode, the stdlib decoder scans for tool calls embedded in text
+_JSON_DECODER = json.JSONDecoder()
+
+# Context window of the model, must match PARAMETER num_ctx in the Modelfile
+_NUM_CTX = 4096
+
+# Longest reply the model may generate; routing replies are full answers unless they call a tool
+_MAX_REPLY_TOKENS = 1024
+
+# Rough prompt budget that leaves room for the reply; history is pruned oldest-first to stay
+# under it. The tool schemas sent with the routing call are subtracted at initialize
+_MAX_PROMPT_TOKENS = _NUM_CTX - _MAX_REPLY_TOKENS
+
+# What is left of the prompt budget for the forecast usage history, after the system prompt,
+# the template and a margin for the formatted equipment fields
+_FORECAST_USAGE_TOKENS = _MAX_PROMPT_TOKENS - (len(_FORECAST_SYSTEM_PROMPT) + len(_FORECAST_USER_TEMPLATE)) // 4 - 128
+
+# Prefix of the only failure reply stored in history; it carries no information once the
+# conversation has moved on. Tool errors only reach the follow-up prompt, never history
+_FAILED_REPLY_PREFIX = "Error processing query:"
+
+# Failed exchanges are kept this many exchanges, so the model can still react to them
+_KEEP_FAILED_EXCHANGES = 2
+
+# Seconds to wait for an MCP tool before giving up on it
+_TOOL_TIMEOUT = 20
+
+# Seconds to wait for an LLM reply, or for the next chunk of a streamed one
+_LLM_TIMEOUT = 60
+
+_TIMEOUT_MESSAGE = "Sorry, that took too long to answer. Please try again."
+
+# Keep the model and its prompt cache loaded between requests instead of Ollama's 5 minute default
+_KEEP_ALIVE = "30m"
+
+# Quantized llama3.2 built from the Modelfile, see README
+_MODEL = os.getenv("OLLAMA_MODEL", "roche-booking")
+
+# Generation options per call; context size and default temperature live in the Modelfile
+# so every call shares one loaded model instead of forcing Ollama to reload it.
+# Tool calls need no tighter cap, _read_until_tool_call stops reading once one is complete
+_ROUTING_OPTIONS = {'temperature': 0, 'num_predict': _MAX_REPLY_TOKENS}
+_SUMMARY_OPTIONS = {'num_predict': _MAX_REPLY_TOKENS}
+_FORECAST_OPTIONS = {'num_predict': _MAX_REPLY_TOKENS}
+
+def _ollama_tool(tool: Dict[str, Any]) -> Dict[str, Any]:
+    """Describe an MCP tool in Ollama's native tools format, hiding the injected auth_token"""
+    schema = tool["input_schema"]
+    properties = {name: prop for name, prop in schema.get("properties", {}).items() if name != "auth_token"}
+    required = [name for name in schema.get("required", []) if name != "auth_token"]
+    return {
+        "type": "function",
+        "function": {
+            "name": tool["name"],
+            "description": tool["description"],
+            "parameters": {"type": "object", "properties": properties, "required": required}
+        }
+    }
+
+async def _iter_with_timeout(stream: AsyncIterator[Any], timeout: float) -> AsyncIterator[Any]:
+    """Yield from an async stream, raising TimeoutError if one item takes longer than timeout"""
+    iterator = aiter(stream)
+    while True:
+        try:
+            item = await asyncio.wait_for(anext(iterator), timeout=timeout)
+        except StopAsyncIteration:
+            return
+        yield item
+
+def _estimate_tokens(message: Dict[str, str]) -> int:
+    """Cheap token estimate, about four characters per token"""
+    return len(message["content"]) // 4
+
+def _prune_by_tokens(messages: List[Dict[str, str]], max_tokens: int = _MAX_PROMPT_TOKENS) -> List[Dict[str, str]]:
+    """Drop the oldest history exchanges until the prompt fits the token budget"""
+    total = sum(_estimate_tokens(message) for message in messages)
+    if total <= max_tokens:
+        return messages
+
+    # Keep the system prompt and the current query; drop history a user/assistant pair at a time
+    start = 1
+    while total > max_tokens and start + 2 < len(messages):
+        total -= _estimate_tokens(messages[start]) + _estimate_tokens(messages[start + 1])
+        start += 2
+    return [messages[0], *messages[start:]]
+
+def _encode_recent_usage(usage_per_day: List[Dict[str, Any]], max_tokens: int = _FORECAST_USAGE_TOKENS) -> str:
+    """Encode the most recent usage entries that fit the token budget, oldest first"""
+    budget = max_tokens * 4 - 2
+    kept = []
+    for day in reversed(usage_per_day):
+        encoded = orjson.dumps(day)
+        budget -= len(encoded) + 1
+        if budget < 0:
+            break
+        kept.append(encoded)
+    return (b"[" + b",".join(reversed(kept)) + b"]").decode()
+
+class StreamError(str):
+    """Terminal chunk of a reply stream that failed, carrying the message to show instead"""
 
 class MCP_ChatBot:
 
-    def __init__(self):
+    def __init__(self, pool: MCPSessionPool = None):
         # Initialize session and client objects
-        self.session: ClientSession = None
-        self.ollama = ollama.Client()
+        self.pool = pool or mcp_pool
+        # One long-lived httpx pool shared by every Ollama call, reusing keep-alive connections
+        self.ollama = ollama.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+            timeout=120
+        )
         self.available_tools: List[dict] = []
+        self._tool_name_set: frozenset[str] = frozenset()
+        self._ollama_tools: List[dict] = []
+        # Maps each tool the LLM may call to the server tool that serves it
+        self._tool_dispatch: Dict[str, str] = {}
+        self._prompt_budget = _MAX_PROMPT_TOKENS
         self._initialized = False
-        self._stdio_client = None
-        self._client_session = None
         # Add conversation memory
-        self.conversation_history: List[Dict[str, str]] = []
         self.max_history_length = 10  # Keep last 10 exchanges
+        # *2 because each exchange has user + assistant; the deque drops the oldest message itself
+        self.conversation_history: deque[Dict[str, str]] = deque(maxlen=self.max_history_length * 2)
+        # System message followed by the same history dicts, ready to send to the LLM
+        self._message_buffer: List[Dict[str, str]] = [_SYSTEM_MSG]
+        # Each query passes its own token down; concurrent queries share this instance
         self.default_auth_token = os.getenv('API_KEY', 'supersecretdevtoken')
+        # Cache replies to repeated queries and forecasts
+        # Replies can be built on tool results, so they expire no later than those results
+        self._resp_cache = cachetools.TTLCache(maxsize=512, ttl=_TOOL_CACHE_TTL)
+        self.sem_cache_max_turns = _SEM_CACHE_MAX_TURNS
+        self._forecast_cache = cachetools.LRUCache(maxsize=128)
+        self._tool_cache = cachetools.TTLCache(maxsize=256, ttl=_TOOL_CACHE_TTL)
 
     async def initialize(self):
-        """Initialize the MCP connection"""
+        """Connect to the shared MCP session and load its tools"""
         if self._initialized:
             return
             
-        server_params = StdioServerParameters(
-            command="uv",
-            args=["run", "server.py"],
-            env=None,
-        )
-        
-        # Store the connection for proper cleanup
-        self._stdio_client = stdio_client(server_params)
-        self.read, self.write = await self._stdio_client.__aenter__()
-        
-        self._client_session = ClientSession(self.read, self.write)
-        self.session = await self._client_session.__aenter__()
-        
-        await self.session.initialize()
-        response = await self.session.list_tools()
+        # The subprocesses and sessions are shared and outlive any single chatbot or request
+        await self.pool.connect()
+        server_tools = frozenset(tool['name'] for tool in self.pool.available_tools)
+        hidden = set(_RAW_TOOL_VARIANTS.values())
+        self.available_tools = [tool for tool in self.pool.available_tools if tool['name'] not in hidden]
+        self._tool_name_set = frozenset(tool['name'] for tool in self.available_tools)
+        # Prefer compact variants, their results go straight into the follow-up prompt
+        self._tool_dispatch = {
+            name: raw if (raw := _RAW_TOOL_VARIANTS.get(name)) in server_tools else name
+            for name in self._tool_name_set
+        }
+        self._ollama_tools = [_ollama_tool(tool) for tool in self.available_tools]
+        # The routing call sends the tool schemas alongside the messages, budget for them too
+        self._prompt_budget = _MAX_PROMPT_TOKENS - len(orjson.dumps(self._ollama_tools)) // 4
         
-        self.available_tools = [{
-            "name": tool.name,
-            "description": tool.description,
-            "input_schema": tool.inputSchema
-        } for tool in response.tools]
-        
-        print(f"Available tools: {self.available_tools}")
+        logger.debug("Available tools: %s", self.available_tools)
         self._initialized = True
 
     async def cleanup(self):
         """Cleanup connections"""
+        # The shared MCP pool is closed by its owner, see api.lifespan
         try:
-            if self._client_session:
-                await self._client_session.__aexit__(None, None, None)
-            if self._stdio_client:
-                await self._stdio_client.__aexit__(None, None, None)
+            # ollama.AsyncClient has no public close, so close its httpx client directly
+            await self.ollama._client.aclose()
         except Exception as e:
-            print(f"Error during cleanup: {e}")
+            logger.warning("Error during cleanup: %s", e)
         finally:
             self._initialized = False
 
     def add_to_history(self, role: str, content: str):
         """Add a message to conversation history"""
-        self.conversation_history.append({"role": role, "content": content})
-        
-        # Keep only the last max_history_length exchanges
-        if len(self.conversation_history) > self.max_history_length * 2:  # *2 because each exchange has user + assistant
-            self.conversation_history = self.conversation_history[-self.max_history_length * 2:]
+        message = {"role": role, "content": content}
+        if len(self.conversation_history) == self.conversation_history.maxlen:
+            # The deque is about to evict its oldest message, drop it from the buffer too
+            del self._message_buffer[1]
+        self.conversation_history.append(message)
+        self._message_buffer.append(message)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Drop failed exchanges once they are older than the last few exchanges"""
+        history = self.conversation_history
+        cutoff = len(history) - _KEEP_FAILED_EXCHANGES * 2
+        # Drop the user message together with its failed reply to keep the pairing intact
+        stale = set()
+        for i in range(1, cutoff):
+            message = history[i]
+            if (message["role"] == "assistant"
+                    and history[i - 1]["role"] == "user"
+                    and message["content"].startswith(_FAILED_REPLY_PREFIX)):
+                stale.update((i - 1, i))
+        if not stale:
+            return
 
-    def get_conversation_messages(self, system_prompt: str, current_query: str) -> List[Dict[str, str]]:
+        kept = [message for i, message in enumerate(history) if i not in stale]
+        history.clear()
+        history.extend(kept)
+        self._message_buffer[1:] = kept
+
+    def get_conversation_messages(self, current_query: str) -> List[Dict[str, str]]:
         """Build the full conversation context for the LLM"""
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history
-        messages.extend(self.conversation_history)
-        
-        # Add current query
-        messages.append({"role": "user", "content": current_query})
-        
-        return messages
+        return _prune_by_tokens(self._message_buffer + [{"role": "user", "content": current_query}], self._prompt_budget)
 
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        del self._message_buffer[1:]
+
+    def _response_cache_key(self, query: str, auth_token: str) -> bytes | None:
+        """Key a query by its auth token, normalized text and recent history"""
+        if len(self.conversation_history) > self.sem_cache_max_turns * 2:
+            return None
+        recent = "\x1f".join(m["content"] for m in list(self.conversation_history)[-4:])
+        key_material = f"{auth_token}|{query.strip().lower()}|{recent}"
+        return hashlib.blake2b(key_material.encode(), digest_size=16).digest()
 
     async def process_query(self, query: str, auth_token: str = None) -> str:
         """Process a query and return the response"""
+        parts = []
+        try:
+            async for token in self._generate_reply(query, auth_token):
+                parts.append(token)
+        except Exception as e:
+            # Drop any partial reply, the caller gets only the failure message
+            return self._failure_reply(query, e)
+        return "".join(parts)
+
+    async def process_query_stream(self, query: str, auth_token: str = None) -> AsyncIterator[str]:
+        """Process a query and yield the response as it is generated
+
+        A failure, even after part of the reply was sent, ends the stream with a StreamError chunk.
+        """
+        try:
+            async for token in self._generate_reply(query, auth_token):
+                yield token
+        except Exception as e:
+            yield StreamError(self._failure_reply(query, e))
+
+    def _failure_reply(self, query: str, error: Exception) -> str:
+        """Log a failed query and return the message shown in place of its reply"""
+        if isinstance(error, TimeoutError):
+            # Keep the timed-out turn out of history so a retry starts clean
+            logger.warning("Query timed out: %s", query)
+            return _TIMEOUT_MESSAGE
+        error_msg = f"{_FAILED_REPLY_PREFIX} {error}"
+        logger.error("%s", error_msg, exc_info=error)
+        self.add_to_history("user", query)
+        self.add_to_history("assistant", error_msg)
+        return error_msg
+
+    async def _generate_reply(self, query: str, auth_token: str = None) -> AsyncIterator[str]:
+        """Yield the reply to a query as it is generated, raising if generation fails"""
         if not self._initialized:
             await self.initialize()
         
-        # Store the auth_token for use in tool execution
-        self.current_auth_token = auth_token or self.default_auth_token
+        # Kept local, other queries run while this one awaits the LLM and tools
+        auth_token = auth_token or self.default_auth_token
         
-        client = self.ollama
+        cache_key = self._response_cache_key(query, auth_token)
+        cached = self._resp_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            logger.debug("Returning cached response")
+            self.add_to_history("user", query)
+            self.add_to_history("assistant", cached)
+            yield cached
+            return
         
-        # DON'T mention the auth_token in the system prompt to prevent hallucination
-        system_prompt = """You are a helpful equipment booking assistant at Roche. 
-
-You have access to the following tools:
-
-1. search_equipment(site_name) - Search for available equipment at a specific site.
-2. book_equipment(equipment_ids, date, time_start, time_end, number_of_people, reason, timezone) - Create a booking for equipment.
-
-CRITICAL RULES FOR EQUIPMENT BOOKING:
-- Use the EXACT equipment ID for Booking from the search results
-- DO NOT hallucinate equipment ID for Booking
-
-IMPORTANT RULES:
-- Use only ONE tool call per response
-- When you need to use a tool, respond ONLY with the JSON object, no additional text
-- If you need to use multiple tools, do them in separate responses
-- When using the book_equipment tool, ensure to pass the EXACT ID for Booking field from the search results
-
-WORKFLOW:
-1. For equipment booking requests: First search for equipment, then book using the EXACT ID for Booking
-2. Always use the full UUID format for equipment IDs
-3. Never truncate or modify equipment IDs
-
-Tool call format:
-{"tool_name": "function_name", "arguments": {"param1": "value1", "param2": "value2"}}
-
-Examples:
-- {"tool_name": "search_equipment", "arguments": {"site_name": "Basel pRED"}}
-- {"tool_name": "book_equipment", "arguments": {"equipment_ids": "09ed436d-7c04-4c74-84f2-54b213cfb0fd", "date": "2025-07-18", "time_start": "14:30", "time_end": "17:00", "number_of_people": 3, "reason": "Calibration tests", "timezone": "Europe/Zurich"}}
-
-Remember: Equipment IDs are always in UUID format (8-4-4-4-12 characters) and must be copied exactly!"""
-
-        # Different system prompt for follow-up responses
-        follow_up_system_prompt = """You are a helpful equipment booking assistant at Roche. 
-    You have just executed a tool and received the results. Your job is to provide a clear, human-readable summary of the results to the user.
-
-    IMPORTANT: Do NOT return JSON. Provide a natural language response that summarizes the tool results in a helpful way."""
-
-        try:
-            # Build conversation with history
-            messages = self.get_conversation_messages(system_prompt, query)
+        # Build conversation with history
+        messages = self.get_conversation_messages(query)
+        
+        # Greedy decoding keeps tool-call JSON stable and parseable
+        stream = await asyncio.wait_for(
+            self.ollama.chat(
+                model=_MODEL,
+                messages=messages,
+                tools=self._ollama_tools,
+                options=_ROUTING_OPTIONS,
+                keep_alive=_KEEP_ALIVE,
+                stream=True
+            ),
+            timeout=_LLM_TIMEOUT
+        )
+        
+        # Check if the response contains a tool call
+        response_content, tool_call = await self._read_until_tool_call(stream)
+        logger.debug("Model response: %s", response_content)
+        
+        if tool_call:
+            tool_name = tool_call['tool_name']
+            tool_args = tool_call['arguments']
+            
+            logger.debug("Executing tool: %s with args: %s", tool_name, tool_args)
             
-            response = client.chat(
-                model='llama3.2',
-                messages=messages
+            # Execute the tool
+            result = await self.execute_tool(tool_name, tool_args, auth_token)
+            logger.debug("Tool result: %s", result)
+            
+            # Build follow-up messages with different system prompt
+            follow_up_messages = [
+                {"role": "system", "content": _FOLLOWUP_SYSTEM_PROMPT},
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": response_content},
+                {"role": "user", "content": f"Tool execution completed. Here are the results:\n\n{result}\n\nPlease provide a helpful summary of these results for the user."}
+            ]
+            
+            logger.debug("Sending follow-up request to LLM...")
+            stream = await asyncio.wait_for(
+                self.ollama.chat(
+                    model=_MODEL,
+                    messages=follow_up_messages,
+                    options=_SUMMARY_OPTIONS,
+                    keep_alive=_KEEP_ALIVE,
+                    stream=True
+                ),
+                timeout=_LLM_TIMEOUT
             )
             
-            response_content = response['message']['content']
-            print(f"Model response: {response_content}")
+            # Forward the summary as it is generated
+            parts = []
+            async for chunk in _iter_with_timeout(stream, _LLM_TIMEOUT):
+                token = chunk['message']['content']
+                if token:
+                    parts.append(token)
+                    yield token
             
-            # Check if the response contains a tool call
-            if self.is_tool_call(response_content):
-                tool_call = self.parse_tool_call(response_content)
-                if tool_call:
-                    tool_name = tool_call['tool_name']
-                    tool_args = tool_call['arguments']
-                    
-                    print(f"Executing tool: {tool_name} with args: {tool_args}")
-                    
-                    # Execute the tool
-                    result = await self.execute_tool(tool_name, tool_args)
-                    print(f"Tool result: {result}")
-                    
-                    # Build follow-up messages with different system prompt
-                    follow_up_messages = [
-                        {"role": "system", "content": follow_up_system_prompt},
-                        {"role": "user", "content": query},
-                        {"role": "assistant", "content": response_content},
-                        {"role": "user", "content": f"Tool execution completed. Here are the results:\n\n{result}\n\nPlease provide a helpful summary of these results for the user."}
-                    ]
-                    
-                    print("Sending follow-up request to LLM...")
-                    final_response = client.chat(
-                        model='llama3.2',
-                        messages=follow_up_messages
-                    )
-                    
-                    final_content = final_response['message']['content']
-                    print(f"Final response: {final_content}")
-                    
-                    # Add to conversation history
-                    self.add_to_history("user", query)
-                    self.add_to_history("assistant", final_content)
-                    
-                    return final_content
-                else:
-                    error_msg = "Failed to parse tool call"
-                    print(f"Error: {error_msg}")
-                    self.add_to_history("user", query)
-                    self.add_to_history("assistant", error_msg)
-                    return error_msg
-            else:
-                print("No tool call detected, returning direct response")
-                # Add to conversation history
-                self.add_to_history("user", query)
-                self.add_to_history("assistant", response_content)
-                return response_content
-                
-        except Exception as e:
-            error_msg = f"Error processing query: {e}"
-            print(f"Exception: {error_msg}")
+            final_content = "".join(parts)
+            logger.debug("Final response: %s", final_content)
+            
+            # Only replies built on read-only tools are safe to replay
+            if cache_key and tool_name in _READ_ONLY_TOOLS and not result.startswith("Error"):
+                self._resp_cache[cache_key] = final_content
+            
+            # Add to conversation history
+            self.add_to_history("user", query)
+            self.add_to_history("assistant", final_content)
+        else:
+            logger.debug("No tool call detected, returning direct response")
+            if cache_key:
+                self._resp_cache[cache_key] = response_content
+            # Add to conversation history
             self.add_to_history("user", query)
-            self.add_to_history("assistant", error_msg)
-            return error_msg
+            self.add_to_history("assistant", response_content)
+            yield response_content
+
+    async def _read_until_tool_call(self, stream: AsyncIterator[Any]) -> tuple[str, Dict[str, Any] | None]:
+        """Read a streamed reply, stopping generation as soon as a complete tool call has arrived"""
+        content = ""
+        # Closing the stream drops the HTTP response, which makes Ollama stop generating
+        async with aclosing(stream):
+            async for chunk in _iter_with_timeout(stream, _LLM_TIMEOUT):
+                tool_call = self._native_tool_call(chunk['message'])
+                if tool_call:
+                    # Keep a text form of the call for the follow-up prompt
+                    return content or orjson.dumps(tool_call).decode(), tool_call
+                token = chunk['message']['content']
+                if not token:
+                    continue
+                content += token
+                # Only a closing brace can complete a tool call, so skip parsing otherwise
+                if '}' in token and '"tool_name"' in content and '"arguments"' in content:
+                    tool_call = self._extract_tool_call(content)
+                    if tool_call:
+                        return content, tool_call
+        return content, self._extract_tool_call(content)
+
+    def _native_tool_call(self, message: Any) -> Dict[str, Any] | None:
+        """Take the first structured tool call Ollama parsed out of the reply"""
+        for call in message.get('tool_calls') or ():
+            name = call['function']['name']
+            if name in self._tool_name_set:
+                return {'tool_name': name, 'arguments': dict(call['function']['arguments'])}
+        return None
+
+    def _extract_tool_call(self, content: str) -> Dict[str, Any] | None:
+        """Extract a tool call written out as text, for replies that skip native tool calling"""
+        # Plain-text replies can't contain a tool call, skip JSON parsing entirely
+        if '{' not in content:
+            logger.debug("No tool call detected")
+            return None
 
-    def is_tool_call(self, content: str) -> bool:
-        """Check if the response contains a tool call"""
-        try:
-            # First try to parse the entire content as JSON
-            parsed = json.loads(content.strip())
-            if 'tool_name' in parsed and 'arguments' in parsed:
-                tool_names = [tool['name'] for tool in self.available_tools]
-                if parsed['tool_name'] in tool_names:
-                    print("Tool call detected - full JSON")
-                    return True
-        except:
-            # If that fails, look for JSON within the text
-            import re
-            # More flexible pattern that handles nested objects better
-            json_pattern = r'\{[^{}]*"tool_name"[^{}]*"arguments"[^{}]*\{[^{}]*\}[^{}]*\}'
-            matches = re.findall(json_pattern, content)
-            if matches:
-                for match in matches:
-                    try:
-                        parsed = json.loads(match)
-                        if 'tool_name' in parsed and 'arguments' in parsed:
-                            tool_names = [tool['name'] for tool in self.available_tools]
-                            if parsed['tool_name'] in tool_names:
-                                print("Tool call detected - regex match")
-                                return True
-                    except:
-                        continue
-            
-            # Try even simpler approach - look for the basic structure
-            if '"tool_name"' in content and '"arguments"' in content:
-                print("Tool call structure detected")
-                return True
-        
-        print("No tool call detected")
-        return False
+        content_stripped = content.strip()
+        if content_stripped.startswith('```json'):
+            content_stripped = content_stripped[7:-3]
+        elif content_stripped.startswith('```'):
+            content_stripped = content_stripped[3:-3]
 
-    def parse_tool_call(self, content: str) -> Dict[str, Any]:
-        """Parse tool call from model response"""
+        # First try to parse the entire content as JSON
         try:
-            # First try to parse the entire content as JSON
-            content_stripped = content.strip()
-            if content_stripped.startswith('```json'):
-                content_stripped = content_stripped[7:-3]
-            elif content_stripped.startswith('```'):
-                content_stripped = content_stripped[3:-3]
-            
+            parsed = orjson.loads(content_stripped)
+            if self._is_valid_tool_call(parsed):
+                logger.debug("Parsed tool call: %s", parsed)
+                return parsed
+        except ValueError:
+            pass
+
+        # Otherwise decode an object starting at each brace; raw_decode handles
+        # nesting and braces inside strings without a regex or manual counting
+        i = content.find('{')
+        while i != -1:
             try:
-                parsed = json.loads(content_stripped)
-                if 'tool_name' in parsed and 'arguments' in parsed:
-                    print(f"Parsed tool call: {parsed}")
+                parsed, _ = _JSON_DECODER.raw_decode(content, i)
+                if self._is_valid_tool_call(parsed):
+                    logger.debug("Parsed embedded tool call: %s", parsed)
                     return parsed
-            except Exception as e:
-                print(f"Failed to parse as full JSON: {e}")
-            
-            # If that fails, try to extract JSON using a more robust approach
-            import re
-            
-            # Look for JSON objects that contain tool_name and arguments
-            json_pattern = r'\{[^{}]*"tool_name"[^{}]*"arguments"[^{}]*\{[^{}]*\}[^{}]*\}'
-            matches = re.findall(json_pattern, content)
-            
-            if matches:
-                # Try to parse each match
-                for match in matches:
-                    try:
-                        parsed = json.loads(match)
-                        if 'tool_name' in parsed and 'arguments' in parsed:
-                            tool_names = [tool['name'] for tool in self.available_tools]
-                            if parsed['tool_name'] in tool_names:
-                                print(f"Parsed tool call from regex: {parsed}")
-                                return parsed
-                    except Exception as e:
-                        print(f"Failed to parse regex match: {e}")
-                        continue
-            
-            # Last resort - try to find and parse any JSON-like structure
-            json_start = content.find('{"tool_name"')
-            if json_start != -1:
-                # Find the matching closing brace
-                brace_count = 0
-                json_end = json_start
-                for i, char in enumerate(content[json_start:], json_start):
-                    if char == '{':
-                        brace_count += 1
-                    elif char == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            json_end = i + 1
-                            break
-                
-                if json_end > json_start:
-                    json_str = content[json_start:json_end]
-                    try:
-                        parsed = json.loads(json_str)
-                        if 'tool_name' in parsed and 'arguments' in parsed:
-                            print(f"Parsed tool call with brace matching: {parsed}")
-                            return parsed
-                    except Exception as e:
-                        print(f"Failed to parse with brace matching: {e}")
-            
-            print("Failed to parse any tool call")
-            return None
-            
-        except Exception as e:
-            print(f"Error parsing tool call: {e}")
-            return None
-            
-    async def execute_tool(self, tool_name: str, tool_args: dict) -> str:
+            except ValueError:
+                pass
+            i = content.find('{', i + 1)
+
+        logger.debug("Failed to parse any tool call")
+        return None
+
+    def _is_valid_tool_call(self, parsed: Any) -> bool:
+        """Check that a parsed object names one of the available tools"""
+        return (
+            isinstance(parsed, dict)
+            and 'arguments' in parsed
+            and parsed.get('tool_name') in self._tool_name_set
+        )
+
+    async def execute_tool(self, tool_name: str, tool_args: dict, auth_token: str = None) -> str:
         """Execute MCP tool"""
+        server_tool = self._tool_dispatch.get(tool_name)
+        if server_tool is None:
+            return f"Error executing tool: unknown tool '{tool_name}'"
         try:
             # Always inject the auth_token - this prevents LLM hallucination
-            current_token = getattr(self, 'current_auth_token', self.default_auth_token)
+            current_token = auth_token or self.default_auth_token
+            tool_args_with_auth = {**tool_args, 'auth_token': current_token}
             
-            # Add auth_token to the arguments
-            tool_args_with_auth = tool_args.copy()
-            tool_args_with_auth['auth_token'] = current_token
+            # Read-only results are replayed for a short while; bookings always hit the server
+            cache_key = None
+            if tool_name in _READ_ONLY_TOOLS:
+                cache_key = (tool_name, current_token, orjson.dumps(tool_args, option=orjson.OPT_SORT_KEYS))
+                cached = self._tool_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug("Returning cached result for tool '%s'", tool_name)
+                    return cached
             
-            print(f"DEBUG: Calling tool '{tool_name}' with args: {tool_args_with_auth}")
-            result = await self.session.call_tool(tool_name, tool_args_with_auth)
-            return str(result.content[0].text) if result.content else "No result"
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Calling tool '%s' with args: %s", server_tool, tool_args)
+            # The limit covers acquiring too, which may spawn server.py and wait for its handshake.
+            # Each pooled session has its own subprocess, so concurrent users don't queue on one pipe
+            async with asyncio.timeout(_TOOL_TIMEOUT):
+                async with self.pool.acquire() as connection:
+                    result = await connection.call_tool(server_tool, tool_args_with_auth)
+            text = str(result.content[0].text) if result.content else "No result"
+            if cache_key is not None and not result.isError and not text.startswith("Error"):
+                self._tool_cache[cache_key] = text
+            return text
+        except TimeoutError:
+            logger.warning("Tool '%s' timed out after %ss", tool_name, _TOOL_TIMEOUT)
+            raise
         except Exception as e:
-            print(f"DEBUG: Tool execution failed: {e}")
+            logger.warning("Tool execution failed: %s", e)
             return f"Error executing tool: {e}"
 
     async def process_forecast(self, data: dict) -> dict:
@@ -333,7 +598,15 @@ Remember: Equipment IDs are always in UUID format (8-4-4-4-12 characters) and mu
         if not self._initialized:
             await self.initialize()
 
-        client = self.ollama
+        try:
+            cache_key = hashlib.blake2b(orjson.dumps(data, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
+        except TypeError:
+            # orjson rejects some valid JSON, e.g. integers beyond 64 bits; skip the cache for it
+            cache_key = None
+        cached = self._forecast_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            logger.debug("Returning cached forecast")
+            return cached
 
         # Extract key metrics from the data
         manufacturer = data.get('manufacturer', 'Unknown')
@@ -347,76 +620,39 @@ Remember: Equipment IDs are always in UUID format (8-4-4-4-12 characters) and mu
         total_hours = sum(day.get('hours', 0) for day in usage_per_day)
         total_bookings = len(usage_per_day)
         
-        system_prompt = """You are a data analyst specializing in equipment utilization forecasting. Your job is to analyze equipment usage data and generate realistic weekly forecasts with insights.
-
-    IMPORTANT: You must respond with ONLY a valid JSON object in the exact format requested. Do not include any explanatory text, markdown formatting, or additional content.
-
-    The response must be a JSON object with two fields:
-    {
-    "forecast": [...], 
-    "insights": "detailed analysis text"
-    }
-
-    Where:
-    - forecast: A JSON array with exactly 6 objects, each representing a week of forecast data
-    - insights: A string containing detailed analysis, trends, and recommendations
-
-    Forecast array structure:
-    [
-    { "week": "Week 1", "utilization": 67, "hours": 145, "bookings": 12 },
-    { "week": "Week 2", "utilization": 72, "hours": 158, "bookings": 14 },
-    ...
-    ]
-
-    Insights should include:
-    - Analysis of current usage patterns
-    - Predicted trends and their reasoning
-    - Potential risks or opportunities
-    - Recommendations for optimization"""
-
-        query = f"""Based on the following equipment data, generate a 6-week forecast with insights:
-
-    Equipment: {manufacturer} {equipment_model}
-    Team: {team_name}
-    Current Utilization Rate: {current_utilization:.2f}%
-    Historical Usage: {len(usage_per_day)} bookings, {total_hours} total hours
-    Average Booking Duration: {avg_booking_duration} minutes
-
-    Historical usage pattern:
-    {json.dumps(usage_per_day, indent=2)}
-
-    Generate a realistic 6-week forecast considering:
-    1. Current usage trends
-    2. Typical equipment utilization patterns
-    3. Potential seasonal variations
-    4. Team workflow patterns
-
-    Response format: JSON object with forecast array and insights string, no additional text."""
-
         try:
+            query = _FORECAST_USER_TEMPLATE.format(
+                manufacturer=manufacturer,
+                equipment_model=equipment_model,
+                team_name=team_name,
+                current_utilization=current_utilization,
+                total_bookings=total_bookings,
+                total_hours=total_hours,
+                avg_booking_duration=avg_booking_duration,
+                # Totals above cover every day; only the recent ones fit in the context window
+                usage_per_day=_encode_recent_usage(usage_per_day)
+            )
+            
             messages = [
-                {"role": "system", "content": system_prompt},
+                _FORECAST_SYSTEM_MSG,
                 {"role": "user", "content": query}
             ]
             
-            response = client.chat(
-                model='llama3.2',
-                messages=messages
+            response = await self.ollama.chat(
+                model=_MODEL,
+                messages=messages,
+                format=_FORECAST_SCHEMA,
+                options=_FORECAST_OPTIONS,
+                keep_alive=_KEEP_ALIVE
             )
             
             response_content = response['message']['content'].strip()
-            print(f"Forecast response: {response_content}")
+            logger.debug("Forecast response: %s", response_content)
             
             # Try to parse and validate the JSON response
             try:
-                # Remove any markdown formatting if present
-                if response_content.startswith('```json'):
-                    response_content = response_content[7:-3]
-                elif response_content.startswith('```'):
-                    response_content = response_content[3:-3]
-                
-                # Parse the JSON to validate it
-                parsed_response = json.loads(response_content)
+                # The schema constrains sampling, so the reply is bare JSON
+                parsed_response = orjson.loads(response_content)
                 
                 # Validate the structure
                 if isinstance(parsed_response, dict) and 'forecast' in parsed_response and 'insights' in parsed_response:
@@ -430,49 +666,43 @@ Remember: Equipment IDs are always in UUID format (8-4-4-4-12 characters) and mu
                                 raise ValueError(f"Missing required keys in week {i+1}")
                         
                         # Return both forecast and insights
-                        return {
-                            "forecast": json.dumps(forecast),
+                        result = {
+                            "forecast": orjson.dumps(forecast).decode(),
                             "insights": insights
                         }
+                        if cache_key:
+                            self._forecast_cache[cache_key] = result
+                        return result
                     else:
                         raise ValueError("Invalid forecast structure")
                 else:
                     raise ValueError("Missing forecast or insights in response")
                     
-            except (json.JSONDecodeError, ValueError) as e:
-                print(f"Failed to parse LLM response as valid JSON: {e}")
+            except ValueError as e:
+                logger.warning("Failed to parse LLM response as valid JSON: %s", e)
                 # Generate a fallback forecast and insights
                 return self._generate_fallback_forecast_with_insights(current_utilization, total_hours, total_bookings)
                 
         except Exception as e:
             error_msg = f"Error processing forecast: {e}"
-            print(f"Exception: {error_msg}")
+            logger.exception("%s", error_msg)
             # Return fallback forecast with insights
             return self._generate_fallback_forecast_with_insights(current_utilization, total_hours, total_bookings)
 
     def _generate_fallback_forecast_with_insights(self, current_utilization: float, total_hours: float, total_bookings: int) -> dict:
         """Generate a fallback forecast with insights if LLM fails"""
-        import json
-        import random
-        
         # Base predictions on current usage with some variation
         base_utilization = max(10, min(90, current_utilization + random.randint(-5, 15)))
         base_hours = max(10, int(total_hours * 1.2 + random.randint(-10, 20)))
         base_bookings = max(5, int(total_bookings * 1.1 + random.randint(-2, 5)))
         
-        forecast = []
-        for i in range(1, 7):
-            # Add some week-to-week variation
-            utilization_variance = random.randint(-8, 12)
-            hours_variance = random.randint(-15, 25)
-            bookings_variance = random.randint(-3, 5)
-            
-            forecast.append({
-                "week": f"Week {i}",
-                "utilization": max(5, min(95, base_utilization + utilization_variance)),
-                "hours": max(5, base_hours + hours_variance),
-                "bookings": max(1, base_bookings + bookings_variance)
-            })
+        # Add some week-to-week variation
+        forecast = [{
+            "week": f"Week {i}",
+            "utilization": max(5, min(95, base_utilization + random.randint(-8, 12))),
+            "hours": max(5, base_hours + random.randint(-15, 25)),
+            "bookings": max(1, base_bookings + random.randint(-3, 5))
+        } for i in range(1, 7)]
         
         insights = f"""Based on historical usage data analysis:
 
@@ -494,6 +724,6 @@ Remember: Equipment IDs are always in UUID format (8-4-4-4-12 characters) and mu
     *Note: This forecast was generated using fallback analysis due to system limitations.*"""
         
         return {
-            "forecast": json.dumps(forecast),
+            "forecast": orjson.dumps(forecast).decode(),
             "insights": insights
         }
\ No newline at end of file
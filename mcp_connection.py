@@ -0,0 +1,195 @@
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.types import CallToolResult
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Any
+import anyio
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SERVER_PARAMS = StdioServerParameters(
+    command="uv",
+    args=["run", "server.py"],
+    env=None,
+)
+
+# Errors raised when the server.py subprocess has gone away under us
+_DISCONNECT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, BrokenPipeError, EOFError)
+
+class MCPConnection:
+    """A long-lived stdio session to the MCP server"""
+
+    def __init__(self, server_params: StdioServerParameters = SERVER_PARAMS):
+        self.server_params = server_params
+        self.session: ClientSession = None
+        self.available_tools: List[dict] = []
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task = None
+        self._closing: asyncio.Event = None
+
+    @property
+    def connected(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def connect(self):
+        """Start the MCP subprocess and session unless they are already running"""
+        async with self._lock:
+            if self.connected:
+                return
+            self._closing = asyncio.Event()
+            ready = asyncio.get_running_loop().create_future()
+            # The stdio transport must be entered and exited by the same task, so a
+            # dedicated task owns it for the lifetime of the connection
+            self._task = asyncio.create_task(self._run(ready))
+            try:
+                await ready
+            except asyncio.CancelledError:
+                # The caller gave up, e.g. on a timeout; don't leave the subprocess starting behind it
+                self._task.cancel()
+                raise
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    response = await session.list_tools()
+                    self.available_tools = [{
+                        "name": tool.name,
+                        "description": tool.description,
+                        "input_schema": tool.inputSchema
+                    } for tool in response.tools]
+                    self.session = session
+                    ready.set_result(None)
+                    logger.debug("MCP session connected")
+                    await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning("MCP session closed unexpectedly: %s", e)
+        finally:
+            self.session = None
+            if not ready.done():
+                ready.cancel()
+
+    async def disconnect(self):
+        """Close the MCP session and stop the subprocess"""
+        async with self._lock:
+            if self._task is None:
+                return
+            self._closing.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> CallToolResult:
+        """Call a tool, reconnecting once if the subprocess has died"""
+        if not self.connected:
+            await self.connect()
+        try:
+            return await self.session.call_tool(name, arguments)
+        except _DISCONNECT_ERRORS as e:
+            logger.warning("MCP session lost (%s), reconnecting", e)
+            await self.disconnect()
+            await self.connect()
+            return await self.session.call_tool(name, arguments)
+
+class MCPSessionPool:
+    """A bounded pool of warm MCP connections, each with its own subprocess"""
+
+    def __init__(self, max_sessions: int = 4, idle_ttl: float = 300.0,
+                 server_params: StdioServerParameters = SERVER_PARAMS):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.server_params = server_params
+        self.available_tools: List[dict] = []
+        self._idle: asyncio.Queue[MCPConnection] = asyncio.Queue()
+        self._connections: List[MCPConnection] = []
+        self._last_used: Dict[MCPConnection, float] = {}
+        self._reaper: asyncio.Task = None
+
+    async def connect(self):
+        """Open the first connection and start expiring idle ones"""
+        if not self._connections:
+            self._release(await self._open())
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._expire_idle())
+
+    async def _open(self) -> MCPConnection:
+        connection = MCPConnection(self.server_params)
+        # Count it before connecting so concurrent acquires respect max_sessions
+        self._connections.append(connection)
+        try:
+            await connection.connect()
+        except BaseException:
+            # Also on cancellation, so a timed-out spawn frees its slot
+            self._connections.remove(connection)
+            raise
+        self.available_tools = connection.available_tools
+        return connection
+
+    def _release(self, connection: MCPConnection):
+        if connection not in self._connections:
+            # The pool was closed while this connection was borrowed
+            return
+        self._last_used[connection] = asyncio.get_running_loop().time()
+        self._idle.put_nowait(connection)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[MCPConnection]:
+        """Borrow a connection, opening a new one while under max_sessions"""
+        try:
+            connection = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            if len(self._connections) < self.max_sessions:
+                connection = await self._open()
+            else:
+                connection = await self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._release(connection)
+
+    async def _expire_idle(self):
+        """Close connections that sat idle for longer than idle_ttl, keeping one warm"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.idle_ttl / 2)
+            now = loop.time()
+            expired = []
+            for _ in range(self._idle.qsize()):
+                connection = self._idle.get_nowait()
+                if (now - self._last_used[connection] > self.idle_ttl
+                        and len(self._connections) - len(expired) > 1):
+                    expired.append(connection)
+                else:
+                    self._idle.put_nowait(connection)
+            for connection in expired:
+                self._connections.remove(connection)
+                del self._last_used[connection]
+                logger.debug("Closing idle MCP connection")
+                await connection.disconnect()
+
+    async def disconnect(self):
+        """Close every connection in the pool"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        connections, self._connections = self._connections, []
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        self._last_used.clear()
+        for connection in connections:
+            await connection.disconnect()
+
+# Shared by every chatbot in this process
+mcp_pool = MCPSessionPool(max_sessions=int(os.getenv("MCP_POOL_SIZE", "4")))
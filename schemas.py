@@ -0,0 +1,44 @@
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+import orjson
+
+MAX_MESSAGE_LENGTH = 8192
+MAX_FORECAST_DATA_BYTES = 32 * 1024
+
+class ChatRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    message: str = Field(max_length=MAX_MESSAGE_LENGTH)
+    auth_token: str = None
+
+class ChatResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    response: str
+
+class CacheThreshold(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    max_turns: int = Field(ge=0)
+
+class ForecastRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    data: dict
+
+    @field_validator("data")
+    @classmethod
+    def check_data_size(cls, data: dict) -> dict:
+        try:
+            size = len(orjson.dumps(data))
+        except TypeError as e:
+            # Pydantic only turns ValueError into a 422, e.g. for integers beyond 64 bits
+            raise ValueError(f"forecast data is not serializable: {e}") from e
+        if size > MAX_FORECAST_DATA_BYTES:
+            raise ValueError(f"forecast data must serialize to at most {MAX_FORECAST_DATA_BYTES} bytes")
+        return data
+
+class ForecastResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    forecast: str
+    insights: str
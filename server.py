@@ -1,7 +1,9 @@
-import requests
+import anyio
+import httpx
 from mcp.server.fastmcp import FastMCP
+from contextlib import asynccontextmanager
 import logging
-import json
+import orjson
 import datetime
 from typing import List
 
@@ -9,13 +11,41 @@ from typing import List
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+backend_url = 'http://127.0.0.1:8000'
+
+# Shared client so tool calls reuse keep-alive connections to the backend
+_http = httpx.AsyncClient(
+    base_url=backend_url,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+)
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    try:
+        yield
+    finally:
+        await _http.aclose()
+
 # Initialize FastMCP server
-mcp = FastMCP("bookings")
+mcp = FastMCP("bookings", lifespan=lifespan)
 
-backend_url = 'http://127.0.0.1:8000'
+# Compact search results list at most this many items, the rest are only counted
+MAX_RAW_RESULTS = 20
+
+async def _fetch_equipment(site_name: str, auth_token: str) -> List[dict]:
+    """Fetch the bookable equipment at a site, raising on an unsuccessful response"""
+    response = await _http.get(
+        "/tools/by-site/bookable",
+        params={"site_name": site_name},
+        headers={"Authorization": f"Bearer {auth_token}"},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.status_code} - {response.text}")
+    return orjson.loads(response.content)
 
 @mcp.tool()
-def search_equipment(site_name: str, auth_token: str) -> str:
+async def search_equipment(site_name: str, auth_token: str) -> str:
     """
     Search for available equipment at a specific site.
     
@@ -30,43 +60,68 @@ def search_equipment(site_name: str, auth_token: str) -> str:
         return "Error: Authorization token not provided."
     
     try:
-        response = requests.get(
-            f"{backend_url}/tools/by-site/bookable?site_name={site_name}",
-            headers={"Authorization": f"Bearer {auth_token}"},
-            timeout=10
-        )
+        equipment_list = await _fetch_equipment(site_name, auth_token)
         
-        if response.status_code == 200:
-            equipment_list = response.json()
-            
-            if not equipment_list:
-                return f"No equipment found at site: {site_name}"
-            
-            # Format the response for better readability
-            result = f"Found {len(equipment_list)} equipment items at {site_name}:\n\n"
-            
-            for idx, equipment in enumerate(equipment_list, 1):
-                location = equipment.get('location', {})
-                responsible = equipment.get('responsible_person', {})
-                
-                result += f"{idx}. {equipment.get('manufacturer', 'Unknown')} {equipment.get('equipment_model', 'Unknown Model')}\n"
-                result += f"   Category: {equipment.get('category', 'Unknown')}\n"
-                result += f"   Material #: {equipment.get('material_number', 'N/A')}\n"
-                result += f"   Location: Room {location.get('room', 'N/A')}, Floor {location.get('floor', 'N/A')}, Building {location.get('building', 'N/A')}\n"
-                result += f"   Contact: {responsible.get('first_name', 'Unknown')} {responsible.get('last_name', '')} ({responsible.get('email', 'N/A')})\n"
-                result += f"   Check-in required: {'Yes' if equipment.get('requires_check_in') else 'No'}\n"
-                result += f"   ID for Booking: {equipment.get('id', 'N/A')}\n\n"
+        if not equipment_list:
+            return f"No equipment found at site: {site_name}"
+        
+        # Format the response for better readability
+        parts = [f"Found {len(equipment_list)} equipment items at {site_name}:\n\n"]
+        
+        for idx, equipment in enumerate(equipment_list, 1):
+            location = equipment.get('location', {})
+            responsible = equipment.get('responsible_person', {})
             
-            return result
+            parts.append(f"{idx}. {equipment.get('manufacturer', 'Unknown')} {equipment.get('equipment_model', 'Unknown Model')}\n")
+            parts.append(f"   Category: {equipment.get('category', 'Unknown')}\n")
+            parts.append(f"   Material #: {equipment.get('material_number', 'N/A')}\n")
+            parts.append(f"   Location: Room {location.get('room', 'N/A')}, Floor {location.get('floor', 'N/A')}, Building {location.get('building', 'N/A')}\n")
+            parts.append(f"   Contact: {responsible.get('first_name', 'Unknown')} {responsible.get('last_name', '')} ({responsible.get('email', 'N/A')})\n")
+            parts.append(f"   Check-in required: {'Yes' if equipment.get('requires_check_in') else 'No'}\n")
+            parts.append(f"   ID for Booking: {equipment.get('id', 'N/A')}\n\n")
+        
+        return "".join(parts)
             
-        else:
-            return f"Error searching equipment: {response.status_code} - {response.text}"
+    except Exception as e:
+        return f"Error searching equipment: {str(e)}"
+
+@mcp.tool()
+async def search_equipment_raw(site_name: str, auth_token: str) -> str:
+    """
+    Search for available equipment at a specific site, as compact JSON for LLM prompts.
+    
+    Args:
+        site_name: The name of the site to search for equipment (e.g., "Basel pRED")
+        auth_token: Authorization token for API access
+    
+    Returns:
+        A JSON list of the first equipment items with their id, manufacturer, model and room
+    """
+    if not auth_token:
+        return "Error: Authorization token not provided."
+    
+    try:
+        equipment_list = await _fetch_equipment(site_name, auth_token)
+        
+        if not equipment_list:
+            return f"No equipment found at site: {site_name}"
+        
+        items = [{
+            "id": equipment.get('id'),
+            "manufacturer": equipment.get('manufacturer'),
+            "model": equipment.get('equipment_model'),
+            "room": equipment.get('location', {}).get('room'),
+        } for equipment in equipment_list[:MAX_RAW_RESULTS]]
+        if len(equipment_list) > MAX_RAW_RESULTS:
+            items.append(f"... +{len(equipment_list) - MAX_RAW_RESULTS} more")
+        
+        return orjson.dumps(items).decode()
             
     except Exception as e:
         return f"Error searching equipment: {str(e)}"
 
 @mcp.tool()
-def book_equipment(
+async def book_equipment(
     equipment_ids: str,
     date: str,
     time_start: str,
@@ -118,40 +173,42 @@ def book_equipment(
             "reason": reason
         }
         
-        logger.debug(f"Booking payload: {json.dumps(payload, indent=2)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Booking payload: %s", orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
                 
-        response = requests.post(
-            f"{backend_url}/bookings",
+        response = await _http.post(
+            "/bookings",
             headers={
                 "Authorization": f"Bearer {auth_token}",
                 "Content-Type": "application/json"
             },
-            json=payload,
-            timeout=10
+            content=orjson.dumps(payload),
         )
         
         if response.status_code == 200 or response.status_code == 201:
-            booking_data = response.json()
+            booking_data = orjson.loads(response.content)
             
             # Format success response
-            result = f"✅ Booking created successfully!\n\n"
-            result += f"Booking Details:\n"
-            result += f"- Equipment IDs: {', '.join(tool_ids)}\n"
-            result += f"- Date: {date}\n"
-            result += f"- Time: {time_start} - {time_end} ({timezone})\n"
-            result += f"- Number of people: {number_of_people}\n"
-            result += f"- Reason: {reason}\n"
+            parts = [
+                "✅ Booking created successfully!\n\n",
+                "Booking Details:\n",
+                f"- Equipment IDs: {', '.join(tool_ids)}\n",
+                f"- Date: {date}\n",
+                f"- Time: {time_start} - {time_end} ({timezone})\n",
+                f"- Number of people: {number_of_people}\n",
+                f"- Reason: {reason}\n",
+            ]
             
             # Add booking ID if available in response
             if isinstance(booking_data, dict) and 'id' in booking_data:
-                result += f"- Booking ID: {booking_data['id']}\n"
+                parts.append(f"- Booking ID: {booking_data['id']}\n")
             
-            return result
+            return "".join(parts)
             
         else:
             error_msg = response.text
             try:
-                error_data = response.json()
+                error_data = orjson.loads(response.content)
                 if isinstance(error_data, dict) and 'detail' in error_data:
                     error_msg = error_data['detail']
             except:
@@ -166,4 +223,5 @@ def book_equipment(
 if __name__ == "__main__":
     # Initialize and run the server
     logger.info("Starting MCP server...")
-    mcp.run(transport='stdio')
\ No newline at end of file
+    # Same as mcp.run(transport='stdio'), but on uvloop for faster stdio I/O
+    anyio.run(mcp.run_stdio_async, backend_options={"use_uvloop": True})
\ No newline at end of file
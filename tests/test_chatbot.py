@@ -0,0 +1,86 @@
+import asyncio
+import types
+import unittest
+from contextlib import asynccontextmanager
+
+import chatbot
+from chatbot import MCP_ChatBot, StreamError
+
+
+class FakeOllama:
+    """Routes every query to search_equipment, then streams the summary and fails mid-way"""
+
+    def __init__(self, failure: BaseException):
+        self.failure = failure
+
+    async def chat(self, messages=None, tools=None, **kwargs):
+        async def routing():
+            yield {'message': {'content': '', 'tool_calls': [
+                {'function': {'name': 'search_equipment', 'arguments': {'site_name': 'Basel'}}}
+            ]}}
+
+        async def summary():
+            yield {'message': {'content': 'Here are 3 items: '}}
+            if isinstance(self.failure, TimeoutError):
+                await asyncio.sleep(1)
+            raise self.failure
+
+        return routing() if tools is not None else summary()
+
+
+class FakePool:
+    available_tools = []
+
+    async def call_tool(self, name, arguments):
+        return types.SimpleNamespace(isError=False, content=[types.SimpleNamespace(text="3 items")])
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+
+def make_bot(failure: BaseException) -> MCP_ChatBot:
+    bot = MCP_ChatBot(FakePool())
+    bot.ollama = FakeOllama(failure)
+    bot._tool_name_set = frozenset({'search_equipment'})
+    bot._tool_dispatch = {'search_equipment': 'search_equipment'}
+    bot._initialized = True
+    return bot
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+class MidStreamFailureTest(unittest.TestCase):
+
+    def setUp(self):
+        timeout = chatbot._LLM_TIMEOUT
+        chatbot._LLM_TIMEOUT = 0.05
+        self.addCleanup(setattr, chatbot, '_LLM_TIMEOUT', timeout)
+
+    def test_timeout_returns_only_the_timeout_message(self):
+        bot = make_bot(TimeoutError())
+        self.assertEqual(asyncio.run(bot.process_query('find Basel')), chatbot._TIMEOUT_MESSAGE)
+        self.assertEqual(list(bot.conversation_history), [])
+
+    def test_timeout_ends_the_stream_with_a_marked_chunk(self):
+        chunks = asyncio.run(collect(make_bot(TimeoutError()).process_query_stream('find Basel')))
+        self.assertEqual(chunks, ['Here are 3 items: ', chatbot._TIMEOUT_MESSAGE])
+        self.assertIsInstance(chunks[-1], StreamError)
+        self.assertNotIsInstance(chunks[0], StreamError)
+
+    def test_exception_returns_only_the_error_message(self):
+        bot = make_bot(ConnectionResetError('conn reset'))
+        reply = asyncio.run(bot.process_query('find Basel'))
+        self.assertEqual(reply, 'Error processing query: conn reset')
+        self.assertEqual(bot.conversation_history[-1], {'role': 'assistant', 'content': reply})
+
+    def test_exception_ends_the_stream_with_a_marked_chunk(self):
+        chunks = asyncio.run(collect(make_bot(ConnectionResetError('conn reset')).process_query_stream('find Basel')))
+        self.assertEqual(chunks, ['Here are 3 items: ', 'Error processing query: conn reset'])
+        self.assertIsInstance(chunks[-1], StreamError)
+
+
+if __name__ == '__main__':
+    unittest.main()